@@ -1,11 +1,20 @@
 import os
+import re
 import json
+import random
 import asyncio
-from typing import Any, Dict, List
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Tuple, TypedDict
 
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ---- Load .env ----
 load_dotenv()
 
@@ -15,17 +24,69 @@ if not API_KEY:
     raise ValueError("Set GOOGLE_API_KEY in your .env file")
 
 genai.configure(api_key=API_KEY)
-model = genai.GenerativeModel("gemini-2.5-flash-lite")
+MODEL_NAME = "models/gemini-2.5-flash-lite"
+
+
+# ---- Structured output ----
+class ChatStep(TypedDict, total=False):
+    step: str
+    content: str
+    question: str
+    function: str
+    input: str
+    output: str
+
+
+# Gemini returns a JSON array of steps, so no JSON has to be fished out of prose
+GENERATION_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=List[ChatStep],
+)
+
 
 MAX_MESSAGES = 10
-CONVERSATION_LOG = "conversation_log.json"
+CONVERSATION_LOG = "conversation_log.jsonl"
 
-# ---- Seed with system prompt ----
+# Cap concurrent Gemini calls so bursts of /chat traffic stay under the QPM quota
+GEMINI_CONCURRENCY = 8
+gemini_semaphore = asyncio.Semaphore(GEMINI_CONCURRENCY)
+
+# ---- System prompt ----
+# Passed as the model's system_instruction (or held in the context cache),
+# never as a turn in the conversation history.
 from .prompts import system_prompt
-messages = [{"role": "model", "parts": [{"text": system_prompt}]}]
+from .cache import ResponseCache, embed_query, query_key
+
+# ---- Per-session history ----
+# (history, lock) per session id, least recently used first. Ids come from
+# clients, so the number of live sessions is capped.
+MAX_SESSIONS = 1000
+SESSIONS: "OrderedDict[str, Tuple[Deque[Dict[str, Any]], asyncio.Lock]]" = OrderedDict()
+
+# ---- Greetings answered locally ----
+# Whole-message match only, so "hi, is Malanjkhand safe?" still goes to Gemini
+GREETING_PATTERN = re.compile(
+    r"^\s*(hi|hello|hey|yo|how are you|good (morning|afternoon|evening))"
+    r"(\s+(there|minescope))?\s*[!.?]*\s*$",
+    re.IGNORECASE,
+)
+GREETING_REPLIES = (
+    "Hello there! How can I help you today?",
+    "Hi! Ask me about any mine's soil, weather, or safety status.",
+    "Hey! Which mine would you like me to check on?",
+)
+
+# ---- Response cache (exact + semantic) ----
+# Saved by persist_response_cache() on an interval and at shutdown, not per request
+response_cache = ResponseCache()
+RESPONSE_CACHE_SAVE_INTERVAL = 60  # seconds
 
 
 # ---------------- Helpers ----------------
+logger = logging.getLogger("minescope")
+LOG_LEVELS = {"warn": logging.WARNING, "error": logging.ERROR}
+
+
 def log_message(level: str, message: str):
     logos = {
         "info": "🟢 [BOT INFO]",
@@ -36,57 +97,61 @@ def log_message(level: str, message: str):
         "bot": "🤖 [BOT]",
     }
     prefix = logos.get(level.lower(), "ℹ️ [BOT]")
-    print(f"{prefix} {message}")
+    logger.log(LOG_LEVELS.get(level.lower(), logging.INFO), "%s %s", prefix, message)
 
 
-def trim_history(msgs, max_len=MAX_MESSAGES):
-    if len(msgs) <= max_len:
-        return msgs
-    return [msgs[0]] + msgs[-(max_len - 1):]
+def get_session(session_id: str):
+    """Return (history, lock) for a session, creating them on first use and evicting the least recently used."""
+    session = SESSIONS.get(session_id)
+    if session is None:
+        session = SESSIONS[session_id] = (deque(maxlen=MAX_MESSAGES - 1), asyncio.Lock())
+        if len(SESSIONS) > MAX_SESSIONS:
+            SESSIONS.popitem(last=False)
+    else:
+        SESSIONS.move_to_end(session_id)
+    return session
 
 
 def append_to_conversation_log(user_query, assistant_response):
     log_entry = {"user_query": user_query, "assistant_response": assistant_response}
     try:
-        try:
-            with open(CONVERSATION_LOG, "r") as f:
-                log_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            log_data = []
-
-        log_data.append(log_entry)
-        with open(CONVERSATION_LOG, "w") as f:
-            json.dump(log_data, f, indent=2)
+        # JSON Lines: one entry per line, appended with a single write
+        if orjson:
+            line = orjson.dumps(log_entry) + b"\n"
+        else:
+            line = (json.dumps(log_entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(CONVERSATION_LOG, "ab") as f:
+            f.write(line)
         log_message("info", f"Logged conversation to {CONVERSATION_LOG}")
     except Exception as e:
         log_message("warn", f"Failed to log conversation: {e}")
 
 
-def extract_all_json(text: str) -> List[Dict[str, Any]]:
-    """Extract all balanced JSON objects from text."""
-    results = []
-    s = text
-    start = None
-    depth = 0
-    for i, ch in enumerate(s):
-        if ch == "{":
-            if depth == 0:
-                start = i
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0 and start is not None:
-                candidate = s[start:i+1]
-                try:
-                    results.append(json.loads(candidate))
-                except Exception:
-                    pass
-                start = None
-    return results
+# ---------------- Model ----------------
+# The system prompt goes in as system_instruction. It is well below Gemini's
+# 1024-token minimum for context caching, so a CachedContent can't be created.
+model = genai.GenerativeModel(
+    MODEL_NAME, system_instruction=system_prompt, generation_config=GENERATION_CONFIG
+)
+
+
+def save_response_cache():
+    try:
+        response_cache.save()
+    except Exception as e:
+        # Entries stay dirty, so the next save retries them
+        log_message("error", f"Failed to save response cache: {e}")
+
+
+async def persist_response_cache(interval: float = RESPONSE_CACHE_SAVE_INTERVAL):
+    """Snapshot the response cache to disk every `interval` seconds; run as a background task."""
+    while True:
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(save_response_cache)
 
 
 # ---------------- Core Function ----------------
-def process_user_query(user_query: str) -> Dict[str, Any]:
+async def process_user_query(user_query: str, session_id: str) -> Dict[str, Any]:
     """
     Process a user query through Gemini and return structured results.
 
@@ -95,38 +160,71 @@ def process_user_query(user_query: str) -> Dict[str, Any]:
         - steps: list of extracted JSON steps
         - final: final user-facing text
     """
-    global messages
-    chat = model.start_chat(history=messages)
+    if GREETING_PATTERN.match(user_query):
+        log_message("info", "Answered greeting locally, skipped Gemini")
+        return {"final": random.choice(GREETING_REPLIES)}
+
+    history, lock = get_session(session_id)
+
+    # ---- Cache lookup: exact match first, then embedding similarity ----
+    # Only a session's opening question is answered from (or stored in) the
+    # cache; later replies depend on the earlier turns, which the key ignores.
+    key = embedding = cached = None
+    if not history:
+        key = query_key(user_query)
+        cached = response_cache.get_exact(key)
+        if cached is None:
+            embedding = await embed_query(user_query)
+            if embedding is not None:
+                cached = response_cache.get_similar(embedding)
+
+    if cached is not None:
+        log_message("info", "Served reply from response cache")
+        async with lock:
+            history.append({"role": "user", "parts": [{"text": user_query}]})
+            history.append({"role": "model", "parts": [{"text": cached}]})
+        await asyncio.to_thread(append_to_conversation_log, user_query, cached)
+        return {"final": cached}
+
+    # Turns within one session are serialized; different sessions run concurrently
+    async with lock:
+        first_turn = not history
+
+        # Add user query
+        history.append({"role": "user", "parts": [{"text": user_query}]})
+
+        # Send the contents directly on the shared model instead of building a ChatSession per call
+        try:
+            async with gemini_semaphore:
+                resp = await model.generate_content_async(list(history))
+        except Exception as e:
+            return {"raw": "", "steps": [], "final": f"❌ Gemini API error: {e}"}
 
-    # Add user query
-    messages.append({"role": "user", "parts": [{"text": user_query}]})
-    messages = trim_history(messages)
+        raw = resp.text.strip()
+        try:
+            steps = json.loads(raw)
+        except ValueError:
+            steps = []
+        if isinstance(steps, dict):
+            steps = [steps]
 
-    try:
-        resp = chat.send_message(user_query)
-    except Exception as e:
-        return {"raw": "", "steps": [], "final": f"❌ Gemini API error: {e}"}
+        # Default fallback
+        final_output = None
+        for step in steps:
+            stype = (step.get("step") or "").lower()
+            if stype == "output":
+                final_output = step.get("content") or step.get("output")
 
-    raw = resp.text.strip()
-    steps = extract_all_json(raw)
+        reply = final_output if final_output else raw
 
-    # Default fallback
-    final_output = None
-    for step in steps:
-        stype = (step.get("step") or "").lower()
-        if stype == "output":
-            final_output = step.get("content") or step.get("output")
+        # Save
+        history.append({"role": "model", "parts": [{"text": reply}]})
 
-    reply = final_output if final_output else raw
+    await asyncio.to_thread(append_to_conversation_log, user_query, reply)
 
-    # Save
-    messages.append({"role": "model", "parts": [{"text": reply}]})
-    messages = trim_history(messages)
-    append_to_conversation_log(user_query, reply)
+    if first_turn and embedding is not None:
+        response_cache.put(key, embedding, reply)
 
     return {
         "final": reply  # Final answer for user
     }
-
-
-
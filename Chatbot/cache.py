@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from typing import NamedTuple, Optional
+
+import numpy as np
+import google.generativeai as genai
+from cachetools import TLRUCache
+
+CACHE_FILE = "response_cache.npz"
+EMBED_MODEL = "models/text-embedding-004"
+SIMILARITY_THRESHOLD = 0.92
+MAX_CACHE_ENTRIES = 512
+# Replies carry live weather/soil/safety data, so they go stale quickly
+CACHE_TTL_SECONDS = 15 * 60
+
+
+# ---------------- Helpers ----------------
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def query_key(query: str) -> str:
+    return hashlib.blake2b(normalize_query(query).encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def embed_query(query: str) -> Optional[np.ndarray]:
+    """Embed a query with Gemini and return it unit-normalized (None on failure)."""
+    try:
+        resp = await genai.embed_content_async(
+            model=EMBED_MODEL,
+            content=normalize_query(query),
+            task_type="semantic_similarity",
+        )
+    except Exception:
+        return None
+
+    vec = np.asarray(resp["embedding"], dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else None
+
+
+class CacheEntry(NamedTuple):
+    embedding: np.ndarray
+    reply: str
+    expires_at: float  # wall-clock, so expiry survives a restart
+
+
+# ---------------- Response Cache ----------------
+class ResponseCache:
+    """
+    Two-tier cache of Gemini replies:
+    - exact match on the normalized query hash
+    - cosine similarity over stored query embeddings
+
+    Entries expire after `ttl` seconds (least recently used are evicted
+    first when full). save() writes an .npz snapshot atomically; call it
+    periodically or on shutdown rather than per request.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = MAX_CACHE_ENTRIES,
+                 threshold: float = SIMILARITY_THRESHOLD, ttl: float = CACHE_TTL_SECONDS):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        # TLRUCache (rather than TTLCache) so restored entries keep their original expiry
+        self._entries = TLRUCache(
+            maxsize=max_entries,
+            ttu=lambda _key, entry, _now: entry.expires_at,
+            timer=time.time,
+        )
+        # Row i holds the unit-normalized embedding of self._keys[i]; rows whose
+        # key has expired are skipped on lookup and pruned on the next put()
+        self._keys = []
+        self._embeddings: Optional[np.ndarray] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer at a time
+        self._load()
+
+    def get_exact(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry.reply if entry else None
+
+    def get_similar(self, embedding: np.ndarray) -> Optional[str]:
+        with self._lock:
+            matrix, keys = self._embeddings, self._keys
+            if matrix is None or matrix.shape[1] != embedding.shape[0]:
+                return None
+
+            sims = matrix @ embedding
+            candidates = np.flatnonzero(sims >= self.threshold)
+            for idx in candidates[np.argsort(-sims[candidates])]:
+                entry = self._entries.get(keys[idx])
+                if entry is not None:
+                    return entry.reply
+        return None
+
+    def put(self, key: str, embedding: np.ndarray, reply: str):
+        with self._lock:
+            self._entries[key] = CacheEntry(embedding, reply, time.time() + self.ttl)
+            self._rebuild_index()
+            self._dirty = True
+
+    def save(self):
+        """Write a snapshot to disk (temp file + os.replace) if anything changed."""
+        # Only the snapshot is taken under the lookup lock, so a slow disk
+        # never blocks get_exact()/get_similar()/put() on the event loop
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                items = self._live_items()
+                self._dirty = False
+
+            try:
+                keys = np.array([key for key, _ in items], dtype=str)
+                expires_at = np.array([e.expires_at for _, e in items], dtype=np.float64)
+                embeddings = np.stack([e.embedding for _, e in items]) if items else np.empty((0, 0), np.float32)
+                # Replies are variable-length text; store them as one UTF-8 JSON blob
+                replies = np.frombuffer(json.dumps([e.reply for _, e in items]).encode("utf-8"), dtype=np.uint8)
+                self._write(keys=keys, expires_at=expires_at, embeddings=embeddings, replies=replies)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _write(self, **arrays):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as tmp:
+                tmp_path = tmp.name
+                np.savez(tmp, **arrays)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _live_items(self):
+        self._entries.expire()
+        items = []
+        for key in list(self._entries.keys()):
+            entry = self._entries.get(key)  # may still expire between expire() and here
+            if entry is not None:
+                items.append((key, entry))
+        return items
+
+    def _rebuild_index(self):
+        items = self._live_items()
+        self._keys = [key for key, _ in items]
+        if not self._keys:
+            self._embeddings = None
+            return
+        embeddings = [entry.embedding for _, entry in items]
+        if len({e.shape for e in embeddings}) != 1:
+            # Embedding model changed: keep only entries matching the newest one
+            newest = embeddings[-1].shape
+            self._keys = [k for k, e in zip(self._keys, embeddings) if e.shape == newest]
+            embeddings = [e for e in embeddings if e.shape == newest]
+        self._embeddings = np.stack(embeddings)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                keys = data["keys"].tolist()
+                expires_at = data["expires_at"].tolist()
+                embeddings = data["embeddings"]
+                replies = json.loads(data["replies"].tobytes().decode("utf-8"))
+        except (OSError, ValueError, KeyError):
+            return
+
+        now = time.time()
+        for key, expiry, embedding, reply in zip(keys, expires_at, embeddings, replies):
+            if expiry > now:
+                self._entries[key] = CacheEntry(embedding, reply, expiry)
+        self._rebuild_index()
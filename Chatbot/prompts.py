@@ -14,8 +14,9 @@ Rules for handling queries:
    - Safety assessment (safe/unsafe with reasons)
 5) Never end the response at "plan", "action", or "observe". 
    The final user-facing message must always be in the "output" step.
-6) If the user sends casual conversation (e.g., "hello", "how are you", "hi"), respond normally 
-   in natural language without using the structured "plan → action → observe → output" steps.
+6) If the user sends casual conversation (e.g., "hello", "how are you", "hi"), skip the 
+   "plan → action → observe" steps and reply naturally inside a single "output" step.
+7) Always respond with a JSON array of step objects.
 
 Valid steps:
 - { "step": "plan", "content": "<short plan>" }
@@ -50,5 +51,5 @@ available_tools = {
 
 Special instruction:
 - For casual greetings, small talk, or general questions not related to mines, provide 
-  a natural human-like response directly without using the structured JSON steps.
+  a natural human-like response as the content of a single "output" step.
 """
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 import json
-from typing import Any, Dict
+from typing import Any, Dict, List, TypedDict
+import numpy as np
 import google.generativeai as genai
 from dotenv import load_dotenv
 from Master_LLM.ML_Models.Inside_cave.model.inside_cave import process_video_file
@@ -13,90 +14,95 @@ API_KEY = os.getenv("GOOGLE_API_KEY1")
 if not API_KEY:
     raise ValueError("Set GOOGLE_API_KEY in your .env file")
 genai.configure(api_key=API_KEY)
-model = genai.GenerativeModel("gemini-2.5-flash-lite")
+MODEL_NAME = "models/gemini-2.5-flash-lite"
 
-# ---------------- Helpers ----------------
-def safe_json_loads(text: str):
-    """Clean and parse JSON safely."""
-    try:
-        cleaned = text.strip()
-        if cleaned.startswith("```"):
-            cleaned = cleaned.strip("`")
-            if cleaned.lower().startswith("json"):
-                cleaned = cleaned[4:].strip()
-        return json.loads(cleaned)
-    except Exception:
-        return None
+SUMMARY_PROMPT = """You are analyzing cave-inside video predictions from an ML model.
+Focus on the most important detection (highest confidence) and classify:
+- riskLevel: Low, Medium, or High
+- confidence: integer 0-100
+- rockSize: Small, Medium, Large
+- trajectory: Stable, Moderate, Unstable
+- recommendations: 1-3 short actionable items
+"""
+
+# ---------------- Structured Output ----------------
+class Summary(TypedDict):
+    riskLevel: str
+    confidence: int
+    rockSize: str
+    trajectory: str
+    recommendations: List[str]
+
+
+GENERATION_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=Summary,
+)
+
+# The prompt is below Gemini's 1024-token minimum for context caching,
+# so it is sent as system_instruction
+model = genai.GenerativeModel(
+    MODEL_NAME, system_instruction=SUMMARY_PROMPT, generation_config=GENERATION_CONFIG
+)
 
 # ---------------- Confidence Scaling ----------------
-def scale_confidence(conf: float) -> int:
+def scale_confidence(conf):
     """
     Scale confidence according to piecewise rules:
     - <=40% → same (or minimum 40)
     - 40-55% → 40-90% scaled linearly
     - 55-60% → 90-95% scaled linearly
     - >60% → 98% capped
-    Input conf is float between 0 and 1.
+    Input conf is a float (or array of floats) between 0 and 1;
+    returns an int, or an int array for array input.
     """
-    actual = conf * 100
-
-    if actual <= 40:
-        scaled = actual
-    elif 40 < actual <= 55:
-        scaled = 40 + (actual - 40) * (90 - 40) / (55 - 40)
-    elif 55 < actual <= 60:
-        scaled = 90 + (actual - 55) * (95 - 90) / (60 - 55)
-    else:  # >60
-        scaled = 98
-
-    return int(round(scaled))
+    actual = np.asarray(conf, dtype=np.float64) * 100
+
+    scaled = np.piecewise(
+        actual,
+        [
+            actual <= 40,
+            (actual > 40) & (actual <= 55),
+            (actual > 55) & (actual <= 60),
+            actual > 60,
+        ],
+        [
+            lambda a: a,
+            lambda a: 40 + (a - 40) * (90 - 40) / (55 - 40),
+            lambda a: 90 + (a - 55) * (95 - 90) / (60 - 55),
+            98,
+        ],
+    )
+
+    rounded = np.rint(scaled).astype(int)
+    return int(rounded) if rounded.ndim == 0 else rounded
 
 # ---------------- Gemini Summarization ----------------
 def summarize_with_gemini(predictions: Dict[str, Any]) -> Dict[str, Any]:
-    highest_conf = 0
-    flat_preds = []
-
-    for frame, preds in predictions.items():
-        for p in preds:
-            conf = p.get("confidence", 0)
-            flat_preds.append(f"{frame}: {p['class']} (conf={conf:.2f})")
-            if conf > highest_conf:
-                highest_conf = conf
-
-    preds_text = "\n".join(flat_preds) or "No predictions available"
-
-    system_prompt = """You are analyzing cave-inside video predictions from an ML model.
-Please provide a short human-readable summary (2-3 sentences),
-highlighting the most important detection (highest confidence).
-Also classify:
-- riskLevel: Low, Medium, or High
-- confidence: integer 0-100
-- rockSize: Small, Medium, Large
-- trajectory: Stable, Moderate, Unstable
-- recommendations: 1-3 short actionable items
-
-Return ONLY valid JSON in this format:
-{
-  "riskLevel": "...",
-  "confidence": ...,
-  "rockSize": "...",
-  "trajectory": "...",
-  "recommendations": ["...", "..."]
-}"""
-
-    messages = [
-        {"role": "model", "parts": [{"text": system_prompt}]},
-        {"role": "user", "parts": [{"text": f"Predictions:\n{preds_text}"}]}
+    flat_preds = [
+        (frame, p["class"], p.get("confidence", 0))
+        for frame, preds in predictions.items()
+        for p in preds
     ]
+    confs = np.fromiter((conf for _, _, conf in flat_preds), dtype=np.float64, count=len(flat_preds))
+    highest_conf = float(confs.max(initial=0.0))
+
+    preds_text = "\n".join(
+        f"{frame}: {cls} (conf={conf:.2f})" for frame, cls, conf in flat_preds
+    ) or "No predictions available"
+
+    # One user turn carrying both parts; consecutive "user" turns are not a valid exchange
+    contents = [{
+        "role": "user",
+        "parts": [
+            {"text": f"Predictions:\n{preds_text}"},
+            {"text": "Summarize predictions as instructed."},
+        ],
+    }]
 
     try:
-        chat = model.start_chat(history=messages)
-        resp = chat.send_message("Summarize predictions as instructed.")
-        text = resp.text.strip()
-        summary = safe_json_loads(text)
-
-        if not summary:
-            raise ValueError("Gemini returned invalid JSON")
+        resp = model.generate_content(contents)
+        summary = json.loads(resp.text)
 
         # Apply scaling logic to highest confidence
         summary["confidence"] = scale_confidence(highest_conf)
@@ -161,8 +167,13 @@ def conclusion_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
         if trajectory == "Unstable":
             recommendations.append("Reinforce support structures")
 
-    # Remove duplicates
-    recommendations = list(dict.fromkeys(recommendations))
+    # Remove duplicates (order-preserving)
+    seen, unique = set(), []
+    for rec in recommendations:
+        if rec not in seen:
+            seen.add(rec)
+            unique.append(rec)
+    recommendations = unique
 
     # ----- Return adjusted analysis -----
     return {
@@ -174,12 +185,7 @@ def conclusion_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 # ---------------- Core Function ----------------
-def process_video_and_summarize(video_file: Any) -> Dict[str, Any]:
-    try:
-        all_predictions = process_video_file(video_file)
-    except Exception as e:
-        return {"success": False, "error": f"❌ Video processing failed: {e}"}
-
+def analyze_predictions(all_predictions: Dict[str, Any]) -> Dict[str, Any]:
     summary = summarize_with_gemini(all_predictions)
 
     analysis = {
@@ -197,6 +203,15 @@ def process_video_and_summarize(video_file: Any) -> Dict[str, Any]:
 
     return {"success": True, "analysis": final_analysis}
 
+
+def process_video_and_summarize(video_file: Any) -> Dict[str, Any]:
+    try:
+        all_predictions = process_video_file(video_file)
+    except Exception as e:
+        return {"success": False, "error": f"❌ Video processing failed: {e}"}
+
+    return analyze_predictions(all_predictions)
+
 # ---------------- Example Usage ----------------
 if __name__ == "__main__":
     test_video = r"C:\Users\KAIZEN\Downloads\vedio_testing\inner_cave\generated-video.mp4"
@@ -0,0 +1,296 @@
+import cv2
+import json
+import base64
+import asyncio
+import logging
+import weakref
+import threading
+from collections import deque
+from contextlib import aclosing
+from itertools import islice
+import httpx
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("minescope")
+
+ROBOFLOW_API_URL = "https://serverless.roboflow.com"
+BATCH_SIZE = 8  # sampled frames sent per workflow request
+MAX_IN_FLIGHT = 4  # concurrent batch requests per video
+MAX_QUEUED_BATCHES = 2 * MAX_IN_FLIGHT  # encoded batches held before frame reading pauses
+JPEG_QUALITY = 85
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+
+# One pooled client per event loop, so keep-alive connections are reused across videos
+_http_clients = weakref.WeakKeyDictionary()
+_thread_state = threading.local()
+
+
+def get_http_client():
+    """Return the shared AsyncClient for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _http_clients[loop] = httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=60.0)
+    return client
+
+
+def run_sync(coro):
+    """Run coro on this thread's long-lived event loop (unlike asyncio.run, its HTTP client survives between calls)."""
+    loop = getattr(_thread_state, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _thread_state.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coro)
+
+
+# ---------------- Frame Sampling ----------------
+def open_video(video_path, interval_sec):
+    """Open a video and return (capture, frame_interval) for sampling every interval_sec."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError("❌ Error: Cannot open video")
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    return cap, max(1, int(fps * interval_sec))
+
+
+def iter_sampled_frames(cap, frame_interval, start=0):
+    """
+    Yield every frame_interval-th frame from sample number `start` on, seeking
+    past the frames in between instead of decoding them.
+    """
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total_frames > 0:
+        for idx in range(start * frame_interval, total_frames, frame_interval):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+        return
+
+    # Frame count unknown: grab() skips the retrieve/convert step for unused frames
+    idx = 0
+    while cap.grab():
+        if idx % frame_interval == 0 and idx >= start * frame_interval:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            yield frame
+        idx += 1
+
+
+def encode_frame(frame):
+    """JPEG-encode a frame in memory and return it base64'd for the workflow API."""
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise RuntimeError("❌ Error: Cannot encode frame")
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+async def iter_video_chunks(video_path, interval_sec=2):
+    """
+    Yield a video's sampled frames as [(frame_id, image_b64)] chunks of up to
+    BATCH_SIZE. Each chunk is decoded and encoded in a worker thread, so
+    requests for earlier chunks keep running meanwhile.
+    """
+    cap, frame_interval = open_video(video_path, interval_sec)
+    frames = enumerate(encode_frame(frame) for frame in iter_sampled_frames(cap, frame_interval))
+    # A cancelled read keeps running in its thread; don't release the capture under it
+    lock = threading.Lock()
+
+    def read_chunk():
+        with lock:
+            return list(islice(frames, BATCH_SIZE))
+
+    try:
+        while True:
+            chunk = await asyncio.to_thread(read_chunk)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        with lock:
+            cap.release()
+
+
+def count_frames(video_path):
+    """Return the frame count the container reports; 0 (or less) if it doesn't report one."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+def sample_video_chunk(video_path, interval_sec, start, count=BATCH_SIZE):
+    """
+    Decode and JPEG-encode up to `count` sampled frames, starting at sample `start`.
+    Only for videos with a known frame count: otherwise there is nothing to seek
+    by and every chunk would re-read the video from the beginning.
+
+    CPU-bound with picklable input/output, so it can run in a worker process.
+
+    Returns:
+        list: [(frame_id, image_b64)]; shorter than count at the end of the video.
+    """
+    cap, frame_interval = open_video(video_path, interval_sec)
+    try:
+        frames = islice(iter_sampled_frames(cap, frame_interval, start), count)
+        return [(frame_id, encode_frame(frame)) for frame_id, frame in enumerate(frames, start)]
+    finally:
+        cap.release()
+
+
+async def iter_video_chunks_in_pool(executor, video_path, interval_sec=2, prefetch=2):
+    """
+    Like iter_video_chunks, but each chunk is sampled by `executor` (e.g. a
+    process pool), keeping `prefetch` chunks in progress so decoding overlaps
+    with inference on the chunks already yielded.
+
+    Videos without a frame count (e.g. browser-recorded WebM) can't be split
+    into seekable chunks, so they are read once, sequentially, by iter_video_chunks.
+    """
+    loop = asyncio.get_running_loop()
+    if await loop.run_in_executor(executor, count_frames, video_path) <= 0:
+        async with aclosing(iter_video_chunks(video_path, interval_sec)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+        return
+
+    def submit(chunk_index):
+        return loop.run_in_executor(
+            executor, sample_video_chunk, video_path, interval_sec, chunk_index * BATCH_SIZE,
+        )
+
+    pending = deque(submit(i) for i in range(prefetch))
+    next_index = prefetch
+    try:
+        while pending:
+            chunk = await pending.popleft()
+            if len(chunk) < BATCH_SIZE:
+                # End of video; any chunks still pending are past it
+                if chunk:
+                    yield chunk
+                return
+            pending.append(submit(next_index))
+            next_index += 1
+            yield chunk
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+# ---------------- Workflow Inference ----------------
+async def run_workflow(client, api_key, workspace_name, workflow_id, images_b64):
+    """POST a batch of base64 images to a Roboflow workflow and return one output per image."""
+    resp = await client.post(
+        f"{ROBOFLOW_API_URL}/{workspace_name}/workflows/{workflow_id}",
+        json={
+            "api_key": api_key,
+            "use_cache": True,
+            "inputs": {"image": [{"type": "base64", "value": image} for image in images_b64]},
+        },
+    )
+    resp.raise_for_status()
+    return resp.json()["outputs"]
+
+
+async def infer_batch(client, semaphore, api_key, workspace_name, workflow_id, batch, conf_threshold):
+    """Run a batch of (frame_id, image_b64) through the workflow and return [(frame_id, predictions)]."""
+    frame_ids = [frame_id for frame_id, _ in batch]
+    images_b64 = [image for _, image in batch]
+
+    # Run workflow
+    async with semaphore:
+        outputs = await run_workflow(client, api_key, workspace_name, workflow_id, images_b64)
+
+    # Filter predictions
+    results = []
+    for frame_id, output in zip(frame_ids, outputs):
+        cleaned_predictions = []
+        for pred in output["model_predictions"]["predictions"]:
+            if pred.get("confidence", 0) >= conf_threshold:
+                pred_copy = {k: v for k, v in pred.items() if k != "points"}
+                cleaned_predictions.append(pred_copy)
+        results.append((frame_id, cleaned_predictions))
+
+    return results
+
+
+async def _next_chunk(chunks):
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def stream_predictions(chunks, api_key, workspace_name, workflow_id, conf_threshold=0.4):
+    """
+    Send each [(frame_id, image_b64)] chunk from the async iterable `chunks` to
+    the workflow as soon as it arrives, yielding (frame_id, predictions) as
+    batches complete (completion order, not frame order).
+
+    Reading stops while MAX_QUEUED_BATCHES batches are waiting, so a long video
+    is never held in memory all at once.
+    """
+    semaphore = asyncio.Semaphore(MAX_IN_FLIGHT)
+    client = get_http_client()
+    chunks = chunks.__aiter__()
+    reader = None  # task fetching the next chunk
+    batches = set()
+    exhausted = False
+
+    try:
+        while True:
+            if reader is None and not exhausted and len(batches) < MAX_QUEUED_BATCHES:
+                reader = asyncio.ensure_future(_next_chunk(chunks))
+
+            waiting = (batches | {reader}) if reader else batches
+            if not waiting:
+                return
+
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is reader:
+                    reader = None
+                    chunk = task.result()
+                    if chunk is None:
+                        exhausted = True
+                    else:
+                        batches.add(asyncio.create_task(infer_batch(
+                            client, semaphore, api_key, workspace_name, workflow_id, chunk, conf_threshold,
+                        )))
+                else:
+                    batches.discard(task)
+                    for frame_id, predictions in task.result():
+                        yield frame_id, predictions
+    finally:
+        # Client disconnected or a batch failed: stop reading and the remaining requests
+        for task in (batches | {reader}) if reader else batches:
+            task.cancel()
+
+
+async def collect_predictions(predictions):
+    """Drain (frame_id, predictions) pairs into a {"frame_N": predictions} dict in frame order."""
+    by_frame = {}
+    async for frame_id, frame_predictions in predictions:
+        by_frame[frame_id] = frame_predictions
+    return order_predictions(by_frame)
+
+
+def order_predictions(by_frame):
+    """Turn {frame_id: predictions} into {"frame_N": predictions} in frame order."""
+    return {f"frame_{frame_id}": by_frame[frame_id] for frame_id in sorted(by_frame)}
+
+
+def write_predictions(output_path, predictions):
+    if orjson:
+        with open(output_path, "wb") as f:
+            f.write(orjson.dumps(predictions, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, "w") as f:
+            json.dump(predictions, f, indent=2)
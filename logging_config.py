@@ -0,0 +1,39 @@
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = "minescope"
+LOG_FORMAT = "%(asctime)s %(message)s"
+
+
+def start_logging(level=logging.INFO) -> QueueListener:
+    """
+    Route the "minescope" logger through an in-memory queue.
+
+    Request handlers only enqueue records; the returned listener formats and
+    writes them on a background thread. Call listener.stop() on shutdown.
+    """
+    log_queue = queue.SimpleQueue()
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.handlers = [QueueHandler(log_queue)]
+    logger.propagate = False
+
+    listener.start()
+    return listener
+
+
+def configure_worker_logging(level=logging.INFO):
+    """Plain stream logging for worker processes, which don't share the parent's queue."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+    logger.handlers = [handler]
+    logger.propagate = False
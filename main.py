@@ -1,10 +1,55 @@
+import os
+import uuid
+import json
+import shutil
+import asyncio
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Optional
 from pydantic import BaseModel
-from Chatbot.Chatbot import process_user_query
-from Master_LLM.ML_Models.Inside_cave.genai import process_video_and_summarize
+from Chatbot.Chatbot import process_user_query, persist_response_cache, save_response_cache
+from Master_LLM.ML_Models.Inside_cave.genai import analyze_predictions
+from Master_LLM.ML_Models.Inside_cave.model.inside_cave import stream_frame_predictions
+from Master_LLM.ML_Models.roboflow_client import iter_video_chunks_in_pool, order_predictions, write_predictions
+from logging_config import start_logging, configure_worker_logging
 
-app = FastAPI(title="Gemini Mine Safety Bot API")
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+VIDEO_WORKERS = 2
+PREDICTIONS_FILE = "predictions_insidecave.json"
+
+# ---- App Lifespan ----
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = start_logging()
+
+    # Frame decoding runs in worker processes so it doesn't hold the GIL for
+    # the API process. "spawn" avoids forking a process with live gRPC threads.
+    app.state.pool = ProcessPoolExecutor(
+        max_workers=VIDEO_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=configure_worker_logging,
+    )
+    cache_saver = asyncio.create_task(persist_response_cache())
+    try:
+        yield
+    finally:
+        cache_saver.cancel()
+        await asyncio.to_thread(save_response_cache)
+        app.state.pool.shutdown(cancel_futures=True)
+        log_listener.stop()
+
+app = FastAPI(title="Gemini Mine Safety Bot API", lifespan=lifespan)
 
 # ---- Enable CORS ----
 origins = [
@@ -18,34 +63,82 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["*"],  # Allow POST, GET, OPTIONS etc.
-    allow_headers=["*"],
+    # Explicit lists let Starlette build the preflight response once instead of
+    # echoing the requested method/headers back on every OPTIONS call
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
 # ---- Request/Response Models ----
 class QueryRequest(BaseModel):
     query: str
+    # Omitted by older clients; they get a fresh session (echoed back in the
+    # response) instead of sharing one history and lock with each other
+    session_id: Optional[str] = None
 
 class QueryResponse(BaseModel):
     final: str
+    session_id: str
 
 # ---- Routes ----
 @app.post("/chat", response_model=QueryResponse)
 async def chat_with_bot(req: QueryRequest):
-    result = process_user_query(req.query)
-    return QueryResponse(**result)
+    session_id = req.session_id or uuid.uuid4().hex
+    result = await process_user_query(req.query, session_id)
+    return QueryResponse(**result, session_id=session_id)
 
 # ---- Video Prediction Endpoint ----
+def spool_upload(upload: UploadFile) -> str:
+    """Copy an upload to a temp file; UploadFile can't be pickled into a worker process."""
+    suffix = os.path.splitext(upload.filename or "")[1] or ".mp4"
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(upload.file, tmp)
+        return tmp.name
+
+def remove_file(path: str):
+    # A worker may still hold the file open (Windows refuses to delete it then)
+    with contextlib.suppress(OSError):
+        os.remove(path)
+
+def ndjson_line(obj) -> bytes:
+    if orjson:
+        return orjson.dumps(obj) + b"\n"
+    return (json.dumps(obj) + "\n").encode("utf-8")
+
 @app.post("/predict_video")
 async def predict_video(file: UploadFile = File(...)):
-    try:
-        predictions = process_video_and_summarize(file.file)
-        return predictions
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"❌ Video processing failed: {e}"
-        }
+    """
+    Stream newline-delimited JSON: one {"frame", "predictions"} line per sampled
+    frame as its inference lands, then a final {"success", "analysis"} line.
+    """
+    video_path = await asyncio.to_thread(spool_upload, file)
+
+    async def stream():
+        try:
+            # Worker processes sample the video chunk by chunk; each chunk is
+            # sent for inference as soon as it is ready
+            chunks = iter_video_chunks_in_pool(app.state.pool, video_path, prefetch=VIDEO_WORKERS)
+
+            by_frame = {}
+            async for frame_id, predictions in stream_frame_predictions(chunks):
+                by_frame[frame_id] = predictions
+                yield ndjson_line({"frame": f"frame_{frame_id}", "predictions": predictions})
+
+            all_predictions = order_predictions(by_frame)
+            await asyncio.to_thread(write_predictions, PREDICTIONS_FILE, all_predictions)
+            yield ndjson_line(await asyncio.to_thread(analyze_predictions, all_predictions))
+        except Exception as e:
+            yield ndjson_line({
+                "success": False,
+                "error": f"❌ Video processing failed: {e}"
+            })
+
+    # The background task also runs if the client disconnects before streaming starts
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(remove_file, video_path),
+    )
     
 # ---- Root Endpoint ----
 @app.get("/")
@@ -0,0 +1,97 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytest
+
+from Master_LLM.ML_Models import roboflow_client
+from Master_LLM.ML_Models.Inside_cave.model import inside_cave
+
+LATENCY = 0.1  # simulated workflow round-trip, seconds
+N_FRAMES = 64
+N_BATCHES = N_FRAMES // roboflow_client.BATCH_SIZE
+
+
+async def slow_workflow(client, api_key, workspace_name, workflow_id, images_b64):
+    await asyncio.sleep(LATENCY)
+    return [
+        {"model_predictions": {"predictions": [{"class": "rock", "confidence": 0.9, "points": []}]}}
+        for _ in images_b64
+    ]
+
+
+def write_video(path, n_frames=N_FRAMES, fps=10):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (64, 48))
+    for i in range(n_frames):
+        writer.write(np.full((48, 64, 3), i * 3, dtype=np.uint8))
+    writer.release()
+
+
+def test_stream_frame_predictions_overlaps_batches(monkeypatch, tmp_path):
+    monkeypatch.setattr(roboflow_client, "run_workflow", slow_workflow)
+    image = roboflow_client.encode_frame(np.zeros((48, 64, 3), dtype=np.uint8))
+
+    async def chunks():
+        for start in range(0, N_FRAMES, roboflow_client.BATCH_SIZE):
+            yield [(frame_id, image) for frame_id in range(start, start + roboflow_client.BATCH_SIZE)]
+
+    async def run():
+        return [item async for item in inside_cave.stream_frame_predictions(chunks(), env_path=str(tmp_path / ".env"))]
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert sorted(frame_id for frame_id, _ in results) == list(range(N_FRAMES))
+    assert all(predictions == [{"class": "rock", "confidence": 0.9}] for _, predictions in results)
+    assert elapsed < N_BATCHES * LATENCY / 2
+
+
+def test_process_video_file_async_overlaps_batches(monkeypatch, tmp_path):
+    monkeypatch.setattr(roboflow_client, "run_workflow", slow_workflow)
+    video_path = tmp_path / "video.avi"
+    output_path = tmp_path / "predictions.json"
+    write_video(video_path)
+
+    start = time.perf_counter()
+    predictions = asyncio.run(inside_cave.process_video_file_async(
+        str(video_path), env_path=str(tmp_path / ".env"), output_path=str(output_path), interval_sec=0.1,
+    ))
+    elapsed = time.perf_counter() - start
+
+    assert list(predictions) == [f"frame_{i}" for i in range(N_FRAMES)]
+    assert output_path.exists()
+    assert elapsed < N_BATCHES * LATENCY / 2
+
+
+@pytest.mark.parametrize("n_frames", [N_FRAMES, N_FRAMES - 3, roboflow_client.BATCH_SIZE - 1])
+def test_iter_video_chunks_in_pool_covers_every_frame(tmp_path, n_frames):
+    video_path = tmp_path / "video.avi"
+    write_video(video_path, n_frames)
+
+    async def run():
+        # Threads stand in for /predict_video's process pool
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            return [chunk async for chunk in roboflow_client.iter_video_chunks_in_pool(pool, str(video_path), 0.1)]
+
+    chunks = asyncio.run(run())
+
+    assert all(len(chunk) == roboflow_client.BATCH_SIZE for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= roboflow_client.BATCH_SIZE
+    assert [frame_id for chunk in chunks for frame_id, _ in chunk] == list(range(n_frames))
+
+
+def test_iter_video_chunks_in_pool_without_frame_count(monkeypatch, tmp_path):
+    monkeypatch.setattr(roboflow_client, "count_frames", lambda video_path: 0)
+    video_path = tmp_path / "video.avi"
+    write_video(video_path)
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            return [chunk async for chunk in roboflow_client.iter_video_chunks_in_pool(pool, str(video_path), 0.1)]
+
+    chunks = asyncio.run(run())
+
+    assert [frame_id for chunk in chunks for frame_id, _ in chunk] == list(range(N_FRAMES))